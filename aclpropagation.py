@@ -0,0 +1,541 @@
+# Standard library imports
+import collections
+import concurrent.futures
+import datetime
+import errno
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import time
+
+
+# Outcomes of AclBackend.update() for a single entry
+APPLIED = "applied"
+SKIPPED = "skipped"
+PROTECTED = "protected"
+
+# Name-surrogate reparse tags: junctions and symlinks point elsewhere and are never followed
+IO_REPARSE_TAG_MOUNT_POINT = 0xA0000003
+IO_REPARSE_TAG_SYMLINK = 0xA000000C
+
+# Windows error codes for an entry that no longer exists
+ERROR_FILE_NOT_FOUND = 2
+ERROR_PATH_NOT_FOUND = 3
+
+
+# Summary returned by AclPropagator.run()
+AclPropagationResult = collections.namedtuple(
+    "AclPropagationResult", ["processed", "applied", "skipped", "protected", "errors", "elapsed", "completed"])
+
+
+# Base class for the ACL backends used by AclPropagator
+class AclBackend:
+
+    # Called once with the root folder before any entry is updated
+    def prepare(self, root):
+        pass
+
+    # Return True if the folder does not inherit permissions from its parent. Only needed for
+    # folders finished by a resumed run, since update() reports protection for everything else
+    def is_protected(self, path):
+        raise NotImplementedError
+
+    # Add the rule to the entry and return APPLIED, SKIPPED or PROTECTED, raising OSError on failure
+    # (FileNotFoundError if the entry is gone). inherited is False only for the root folder; entries
+    # that do not inherit from their parent are left alone, and with skip_existing so are entries
+    # that already carry the rule
+    def update(self, path, is_dir, inherited, skip_existing):
+        raise NotImplementedError
+
+
+# Backend granting "Everyone" FullControl through the Windows security API
+class WindowsAclBackend(AclBackend):
+
+    def __init__(self):
+        # pywin32 is only available on Windows, so import it when the backend is created
+        import ntsecuritycon
+        import pywintypes
+        import win32con
+        import win32file
+        import win32security
+
+        self.ntsecuritycon = ntsecuritycon
+        self.win32con = win32con
+        self.win32file = win32file
+        self.win32security = win32security
+        self.error = pywintypes.error
+        self.everyone = win32security.ConvertStringSidToSid("S-1-1-0")
+
+        # ACEs the root inherits from the folders above it, see prepare()
+        self.above_root_aces = set()
+
+    # Inheritance flags the rule must carry on the given entry
+    def ace_flags(self, is_dir, inherited):
+        flags = 0
+        if is_dir:
+            flags |= self.win32security.CONTAINER_INHERIT_ACE | self.win32security.OBJECT_INHERIT_ACE
+        if inherited:
+            flags |= self.win32security.INHERITED_ACE
+        return flags
+
+    # Open the entry itself rather than the target of a junction or symlink
+    def open_entry(self, path, access):
+        return self.win32file.CreateFile(
+            path, access,
+            self.win32con.FILE_SHARE_READ | self.win32con.FILE_SHARE_WRITE | self.win32con.FILE_SHARE_DELETE,
+            None, self.win32con.OPEN_EXISTING,
+            self.win32con.FILE_FLAG_BACKUP_SEMANTICS | self.win32file.FILE_FLAG_OPEN_REPARSE_POINT, None)
+
+    def os_error(self, e, path):
+        if e.winerror in (ERROR_FILE_NOT_FOUND, ERROR_PATH_NOT_FOUND):
+            return FileNotFoundError(errno.ENOENT, e.strerror, path)
+        return OSError(e.winerror, e.strerror, path)
+
+    def get_descriptor(self, path):
+        handle = self.open_entry(path, self.win32con.READ_CONTROL)
+        try:
+            return self.win32security.GetKernelObjectSecurity(handle, self.win32security.DACL_SECURITY_INFORMATION)
+        finally:
+            handle.Close()
+
+    # SetKernelObjectSecurity writes the DACL of a single entry and, unlike Set-Acl, does not
+    # propagate inheritance down the tree, which is left to AclPropagator
+    def set_descriptor(self, path, descriptor):
+        handle = self.open_entry(path, self.win32con.READ_CONTROL | self.win32con.WRITE_DAC)
+        try:
+            self.win32security.SetKernelObjectSecurity(handle, self.win32security.DACL_SECURITY_INFORMATION, descriptor)
+        finally:
+            handle.Close()
+
+    def is_dacl_protected(self, descriptor):
+        control, _ = descriptor.GetSecurityDescriptorControl()
+        return bool(control & self.win32security.SE_DACL_PROTECTED)
+
+    def is_protected(self, path):
+        try:
+            return self.is_dacl_protected(self.get_descriptor(path))
+        except self.error as e:
+            raise self.os_error(e, path)
+
+    # Identify an ACE regardless of its inheritance flags, which change as it is inherited
+    def ace_key(self, ace):
+        return ((ace[0][0], ace[1], self.win32security.ConvertSidToStringSid(ace[-1]))
+                + tuple(str(part) for part in ace[2:-1]))
+
+    # Remember the ACEs the root inherits from above, so that build_dacl() can place the rule
+    # ahead of them on every entry, as Windows' own inheritance ordering from the root would
+    def prepare(self, root):
+        try:
+            dacl = self.get_descriptor(root).GetSecurityDescriptorDacl()
+        except self.error as e:
+            raise self.os_error(e, root)
+
+        self.above_root_aces = set()
+        if dacl is not None:
+            for index in range(dacl.GetAceCount()):
+                ace = dacl.GetAce(index)
+                if ace[0][1] & self.win32security.INHERITED_ACE:
+                    self.above_root_aces.add(self.ace_key(ace))
+
+    def is_rule(self, ace, flags):
+        (ace_type, ace_flags), mask = ace[0], ace[1]
+        return (ace_type == self.win32security.ACCESS_ALLOWED_ACE_TYPE and ace[2] == self.everyone
+                and mask & self.ntsecuritycon.FILE_ALL_ACCESS == self.ntsecuritycon.FILE_ALL_ACCESS
+                and ace_flags & flags == flags)
+
+    def add_ace(self, path, dacl, ace):
+        (ace_type, ace_flags), mask = ace[0], ace[1]
+        revision = self.win32security.ACL_REVISION_DS
+        if ace_type == self.win32security.ACCESS_ALLOWED_ACE_TYPE:
+            dacl.AddAccessAllowedAceEx(revision, ace_flags, mask, ace[2])
+        elif ace_type == self.win32security.ACCESS_DENIED_ACE_TYPE:
+            dacl.AddAccessDeniedAceEx(revision, ace_flags, mask, ace[2])
+        elif ace_type == self.win32security.ACCESS_ALLOWED_OBJECT_ACE_TYPE:
+            dacl.AddAccessAllowedObjectAce(revision, ace_flags, mask, ace[2], ace[3], ace[4])
+        elif ace_type == self.win32security.ACCESS_DENIED_OBJECT_ACE_TYPE:
+            dacl.AddAccessDeniedObjectAce(revision, ace_flags, mask, ace[2], ace[3], ace[4])
+        else:
+            raise OSError(0, f"Unsupported ACE type {ace_type}, entry left unchanged", path)
+
+    # Rebuild the DACL in canonical order (explicit ACEs before inherited ones) with the rule merged
+    # into any Everyone ACE carrying the same flags, so repeated runs never add duplicates. An
+    # inherited rule goes after ACEs inherited from folders inside the root and before the first
+    # ACE inherited from above it, so an inherited deny from a parent of the share does not win
+    def build_dacl(self, path, dacl, is_dir, inherited):
+        flags = self.ace_flags(is_dir, inherited)
+        explicit_aces, inherited_aces = [], []
+        for index in range(dacl.GetAceCount()):
+            ace = dacl.GetAce(index)
+            (ace_type, ace_flags) = ace[0]
+            if ace_type == self.win32security.ACCESS_ALLOWED_ACE_TYPE and ace_flags == flags and ace[2] == self.everyone:
+                continue
+            if ace_flags & self.win32security.INHERITED_ACE:
+                inherited_aces.append(ace)
+            else:
+                explicit_aces.append(ace)
+
+        rule = ((self.win32security.ACCESS_ALLOWED_ACE_TYPE, flags), self.ntsecuritycon.FILE_ALL_ACCESS, self.everyone)
+        if inherited:
+            position = next((index for index, ace in enumerate(inherited_aces)
+                             if self.ace_key(ace) in self.above_root_aces), len(inherited_aces))
+            inherited_aces.insert(position, rule)
+        else:
+            explicit_aces.append(rule)
+
+        new_dacl = self.win32security.ACL(dacl.GetAclSize() + 8 + self.everyone.GetLength())
+        for ace in explicit_aces + inherited_aces:
+            self.add_ace(path, new_dacl, ace)
+        return new_dacl
+
+    def update(self, path, is_dir, inherited, skip_existing):
+        try:
+            descriptor = self.get_descriptor(path)
+            if inherited and self.is_dacl_protected(descriptor):
+                return PROTECTED
+
+            dacl = descriptor.GetSecurityDescriptorDacl()
+            if dacl is None:
+                # A NULL DACL already grants everyone full access
+                return SKIPPED
+
+            if skip_existing:
+                flags = self.ace_flags(is_dir, inherited)
+                if any(self.is_rule(dacl.GetAce(index), flags) for index in range(dacl.GetAceCount())):
+                    return SKIPPED
+
+            descriptor.SetSecurityDescriptorDacl(1, self.build_dacl(path, dacl, is_dir, inherited), 0)
+            self.set_descriptor(path, descriptor)
+        except self.error as e:
+            raise self.os_error(e, path)
+        return APPLIED
+
+
+# Backend granting read/write (and search on folders) to everyone through POSIX permission bits
+class PosixAclBackend(AclBackend):
+
+    def full_access_mode(self, is_dir):
+        return 0o777 if is_dir else 0o666
+
+    # POSIX permission bits have no inheritance to turn off
+    def is_protected(self, path):
+        return False
+
+    def update(self, path, is_dir, inherited, skip_existing):
+        if inherited and is_dir and self.is_protected(path):
+            return PROTECTED
+
+        st = os.stat(path, follow_symlinks=False)
+        if stat.S_ISLNK(st.st_mode):
+            # The permission bits of a symlink are never used
+            return SKIPPED
+
+        mode = stat.S_IMODE(st.st_mode)
+        full_access = self.full_access_mode(is_dir)
+        if skip_existing and mode & full_access == full_access:
+            return SKIPPED
+
+        os.chmod(path, mode | full_access)
+        return APPLIED
+
+
+# Default location of the checkpoint file for a given root folder
+def default_checkpoint_path(root):
+    digest = hashlib.sha1(os.path.normcase(os.path.abspath(root)).encode("utf-8")).hexdigest()
+    return os.path.join(tempfile.gettempdir(), f"winnmt_acl_{digest}.checkpoint")
+
+
+# Delete the checkpoint of a root folder, e.g. once it is no longer shared
+def discard_checkpoint(root):
+    try:
+        os.remove(default_checkpoint_path(root))
+    except FileNotFoundError:
+        pass
+
+
+# Return True for symlinks and junctions. Other reparse points (deduplicated files, cloud
+# placeholders, HSM stubs) are ordinary files or folders and are processed as usual
+def is_name_surrogate(entry):
+    if entry.is_symlink():
+        return True
+    reparse_tag = getattr(entry.stat(follow_symlinks=False), "st_reparse_tag", 0)
+    return reparse_tag in (IO_REPARSE_TAG_MOUNT_POINT, IO_REPARSE_TAG_SYMLINK)
+
+
+# Return True if the entry is a folder, including folder symlinks and junctions on Windows
+def entry_is_dir(entry):
+    attributes = getattr(entry.stat(follow_symlinks=False), "st_file_attributes", None)
+    if attributes is None:
+        return entry.is_dir(follow_symlinks=False)
+    return bool(attributes & stat.FILE_ATTRIBUTE_DIRECTORY)
+
+
+# Walks a folder tree in parallel and applies an ACL backend's rule to every entry in batches
+class AclPropagator:
+
+    def __init__(self, root, backend, checkpoint_path=None, resume=False, skip_existing=True, workers=None,
+                 batch_size=500, progress_callback=None, should_stop=None,
+                 progress_interval=0.5, checkpoint_interval=5.0):
+        self.root = os.path.abspath(root)
+        self.backend = backend
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.skip_existing = skip_existing
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.batch_size = batch_size
+        self.progress_callback = progress_callback
+        self.should_stop = should_stop or (lambda: False)
+        self.progress_interval = progress_interval
+        self.checkpoint_interval = checkpoint_interval
+
+        # Folders (relative to the root) whose direct entries were all applied by the resumed run
+        self.done_dirs = set()
+        self.root_applied = False
+        self.started = None
+        self.checkpoint_file = None
+        self.checkpoint_torn = False
+
+        self.processed = 0
+        self.applied = 0
+        self.skipped = 0
+        self.protected = 0
+        self.errors = []
+
+    # The checkpoint is an append-only log: a JSON header naming the root and when the run started,
+    # written once the root itself has the rule, followed by one JSON string per completed folder
+    def load_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        if not self.resume:
+            # A new run must not trust folders completed before files were added to them
+            self.remove_checkpoint()
+            return
+
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                lines = f.read().split("\n")
+        except OSError:
+            return
+
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return
+        if not isinstance(header, dict) or header.get("root") != self.root:
+            return
+
+        self.root_applied = True
+        self.started = header.get("started")
+        # An interruption can leave the last line half-written; it is ignored
+        self.checkpoint_torn = lines[-1] != ""
+        for line in lines[1:]:
+            try:
+                self.done_dirs.add(json.loads(line))
+            except ValueError:
+                continue
+
+    def open_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+
+        if self.started is None:
+            self.started = datetime.datetime.now().isoformat(timespec="seconds")
+            self.checkpoint_file = open(self.checkpoint_path, "w", encoding="utf-8")
+            self.checkpoint_file.write(json.dumps({"root": self.root, "started": self.started}) + "\n")
+        else:
+            self.checkpoint_file = open(self.checkpoint_path, "a", encoding="utf-8")
+            if self.checkpoint_torn:
+                self.checkpoint_file.write("\n")
+        self.checkpoint_file.flush()
+
+    def record_done_dir(self, rel_dir):
+        if self.checkpoint_file:
+            self.checkpoint_file.write(json.dumps(rel_dir) + "\n")
+
+    def close_checkpoint(self):
+        if self.checkpoint_file:
+            self.checkpoint_file.close()
+            self.checkpoint_file = None
+
+    def remove_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    # Worker task: list the direct entries of a folder as (path, is_dir, descend) tuples. Symlinks and
+    # junctions are updated themselves but never descended into. Entries of a folder finished by a
+    # resumed run are not updated again, so protection is looked up here to decide whether to descend
+    def list_dir(self, rel_dir, done):
+        entries, errors = [], []
+        counts = {APPLIED: 0, SKIPPED: 0, PROTECTED: 0}
+        with os.scandir(os.path.join(self.root, rel_dir)) as it:
+            for entry in it:
+                rel_path = os.path.join(rel_dir, entry.name)
+                try:
+                    is_dir = entry_is_dir(entry)
+                    descend = is_dir and not is_name_surrogate(entry)
+                    if done and descend and self.backend.is_protected(entry.path):
+                        descend = False
+                except FileNotFoundError:
+                    # Deleted since the folder was listed
+                    if not done:
+                        counts[SKIPPED] += 1
+                    continue
+                except OSError as e:
+                    errors.append((rel_path, e))
+                    continue
+                entries.append((rel_path, is_dir, descend))
+        return entries, counts, errors
+
+    # Worker task: apply the rule to a batch of entries; returns the subfolders to descend into,
+    # leaving out protected ones since their contents inherit from them and not from the root
+    def apply_batch(self, batch):
+        counts = {APPLIED: 0, SKIPPED: 0, PROTECTED: 0}
+        errors, subdirs = [], []
+        for rel_path, is_dir, descend in batch:
+            try:
+                outcome = self.backend.update(os.path.join(self.root, rel_path), is_dir, True, self.skip_existing)
+            except FileNotFoundError:
+                # Deleted since the folder was listed
+                counts[SKIPPED] += 1
+                continue
+            except OSError as e:
+                errors.append((rel_path, e))
+                continue
+            counts[outcome] += 1
+            if descend and outcome != PROTECTED:
+                subdirs.append(rel_path)
+        return counts, errors, subdirs
+
+    def record_counts(self, counts, errors):
+        self.applied += counts[APPLIED]
+        self.skipped += counts[SKIPPED]
+        self.protected += counts[PROTECTED]
+        self.processed += sum(counts.values()) + len(errors)
+        self.errors.extend(errors)
+
+    def report_progress(self, start_time):
+        if self.progress_callback:
+            elapsed = time.monotonic() - start_time
+            rate = self.processed / elapsed if elapsed > 0 else 0.0
+            self.progress_callback(self.processed, rate)
+
+    # Apply the rule to the whole tree; returns an AclPropagationResult
+    def run(self):
+        start_time = time.monotonic()
+        self.load_checkpoint()
+
+        try:
+            self.backend.prepare(self.root)
+            if not self.root_applied:
+                self.backend.update(self.root, True, False, self.skip_existing)
+                self.root_applied = True
+        except OSError as e:
+            self.errors.append((self.root, e))
+            return AclPropagationResult(0, 0, 0, 0, self.errors, time.monotonic() - start_time, False)
+
+        # Closing the checkpoint in a finally block keeps it usable even if a backend fails unexpectedly
+        self.open_checkpoint()
+        try:
+            stopped = self.walk(start_time)
+        finally:
+            self.close_checkpoint()
+
+        self.report_progress(start_time)
+
+        completed = not stopped and not self.errors
+        if completed:
+            self.remove_checkpoint()
+
+        return AclPropagationResult(self.processed, self.applied, self.skipped, self.protected, self.errors,
+                                    time.monotonic() - start_time, completed)
+
+    # Walk the tree below the root; returns True if it was stopped before finishing
+    def walk(self, start_time):
+        dirs_to_list = [""]
+        pending = {}  # future -> (task kind, folder relative to the root)
+        remaining = {}  # folder -> batches still running
+        failed_dirs = set()
+        stopped = False
+        last_progress = last_checkpoint = time.monotonic()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while dirs_to_list or pending:
+                    if not stopped and self.should_stop():
+                        stopped = True
+                        dirs_to_list.clear()
+                        for future in list(pending):
+                            if future.cancel():
+                                del pending[future]
+                        if not pending:
+                            break
+
+                    # Keep listing bounded so batches are not starved on very wide trees
+                    while dirs_to_list and len(pending) < self.workers * 2:
+                        rel_dir = dirs_to_list.pop()
+                        pending[executor.submit(self.list_dir, rel_dir, rel_dir in self.done_dirs)] = ("list", rel_dir)
+
+                    finished, _ = concurrent.futures.wait(
+                        pending, timeout=self.progress_interval, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                    for future in finished:
+                        kind, rel_dir = pending.pop(future)
+
+                        if kind == "list":
+                            try:
+                                entries, counts, errors = future.result()
+                            except FileNotFoundError:
+                                # Deleted since its parent was listed
+                                continue
+                            except OSError as e:
+                                self.errors.append((rel_dir, e))
+                                continue
+
+                            self.record_counts(counts, errors)
+                            if errors:
+                                failed_dirs.add(rel_dir)
+
+                            if rel_dir in self.done_dirs:
+                                if not stopped:
+                                    dirs_to_list.extend(rel_path for rel_path, is_dir, descend in entries if descend)
+                                continue
+                            if stopped:
+                                continue
+                            if not entries:
+                                if not errors:
+                                    self.record_done_dir(rel_dir)
+                                continue
+
+                            batches = [entries[i:i + self.batch_size] for i in range(0, len(entries), self.batch_size)]
+                            remaining[rel_dir] = len(batches)
+                            for batch in batches:
+                                pending[executor.submit(self.apply_batch, batch)] = ("apply", rel_dir)
+                        else:
+                            counts, errors, subdirs = future.result()
+                            self.record_counts(counts, errors)
+                            if not stopped:
+                                dirs_to_list.extend(subdirs)
+                            if errors:
+                                failed_dirs.add(rel_dir)
+
+                            remaining[rel_dir] -= 1
+                            if remaining[rel_dir] == 0:
+                                del remaining[rel_dir]
+                                # Folders with failed entries are retried on the next run
+                                if rel_dir not in failed_dirs:
+                                    self.record_done_dir(rel_dir)
+
+                    now = time.monotonic()
+                    if now - last_progress >= self.progress_interval:
+                        self.report_progress(start_time)
+                        last_progress = now
+                    if self.checkpoint_file and now - last_checkpoint >= self.checkpoint_interval:
+                        self.checkpoint_file.flush()
+                        last_checkpoint = now
+            finally:
+                # Do not let the executor work through the backlog if the walk ends early
+                for future in pending:
+                    future.cancel()
+
+        return stopped
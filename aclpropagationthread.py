@@ -0,0 +1,50 @@
+# Local imports
+from aclpropagation import AclPropagator, WindowsAclBackend, default_checkpoint_path
+
+# Third-party imports
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# Define the AclPropagationThread class
+class AclPropagationThread(QThread):
+    output_signal = pyqtSignal(str)
+    progress_signal = pyqtSignal(int, float)
+
+    # Constructor for the custom QThread class
+    def __init__(self, folder_path, skip_existing=True, resume=False, backend=None, checkpoint_path=None):
+        QThread.__init__(self)  # Call the parent QThread constructor
+        self.folder_path = folder_path  # Set the folder_path attribute to the provided folder path
+        self.skip_existing = skip_existing  # Skip entries that already carry the rule
+        self.resume = resume  # Continue from the checkpoint instead of starting over
+        self.backend = backend  # ACL backend, defaults to the Windows security API
+        self.checkpoint_path = checkpoint_path or default_checkpoint_path(folder_path)  # Resume file
+
+    # The run method is executed when the QThread is started
+    def run(self):
+        try:
+            backend = self.backend or WindowsAclBackend()
+        except ImportError as e:
+            self.output_signal.emit(f"FailedToUpdateACL\n{e}")
+            return
+
+        propagator = AclPropagator(self.folder_path, backend, checkpoint_path=self.checkpoint_path,
+                                   resume=self.resume, skip_existing=self.skip_existing,
+                                   progress_callback=self.progress_signal.emit,
+                                   should_stop=self.isInterruptionRequested)
+        try:
+            result = propagator.run()
+        except Exception as e:
+            # Report unexpected backend failures instead of letting the thread die silently
+            self.output_signal.emit(f"FailedToUpdateACL\n{type(e).__name__}: {e}")
+            return
+
+        summary = (f"{result.processed} entries in {result.elapsed:.1f}s "
+                   f"({result.applied} updated, {result.skipped} skipped, {result.protected} protected, "
+                   f"{len(result.errors)} errors)")
+        errors = "".join(f"\n{path}: {error}" for path, error in result.errors[:20])
+
+        if result.completed:
+            self.output_signal.emit(f"AclPropagationComplete\n{summary}")
+        elif self.isInterruptionRequested():
+            self.output_signal.emit(f"AclPropagationStopped\n{summary}")
+        else:
+            self.output_signal.emit(f"FailedToUpdateACL\n{summary}{errors}")
@@ -44,11 +44,7 @@ class ShareFolderThread(QThread):
 
             New-SmbShare -Name $ShareName -Path $FolderPath -FullAccess "Everyone"
 
-            $Acl = Get-Acl $FolderPath
-            $AccessRule = New-Object System.Security.AccessControl.FileSystemAccessRule("Everyone", "FullControl", "ContainerInherit, ObjectInherit", "None", "Allow")
-            $Acl.AddAccessRule($AccessRule)
-            Set-Acl -Path $FolderPath -AclObject $Acl
-
+            # The NTFS ACL is applied afterwards by AclPropagationThread
             Write-Host "FolderShared"
         }}
 
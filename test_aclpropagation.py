@@ -0,0 +1,382 @@
+# Standard library imports
+import collections
+import errno
+import json
+import os
+import stat
+import sys
+import types
+
+# Third-party imports
+import pytest
+
+# Local imports
+from aclpropagation import AclPropagator, PosixAclBackend, WindowsAclBackend
+
+
+FILE_COUNT = 60
+
+
+# Build a small tree of restricted folders and files below tmp_path/root
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "root"
+    for i in range(6):
+        folder = root.joinpath(*[f"level{j}" for j in range(i % 3)], f"folder{i}")
+        folder.mkdir(parents=True, exist_ok=True)
+        for k in range(FILE_COUNT // 6):
+            file_path = folder / f"file{k}.txt"
+            file_path.write_text("data")
+            file_path.chmod(0o600)
+    return root
+
+
+def all_entries(root):
+    entries = []
+    for folder, dirs, files in os.walk(root):
+        entries += [os.path.join(folder, name) for name in dirs + files]
+    return entries
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path, follow_symlinks=False).st_mode)
+
+
+def assert_full_access(root):
+    for path in all_entries(root):
+        full_access = 0o777 if os.path.isdir(path) else 0o666
+        assert mode(path) & full_access == full_access
+
+
+# Backend that records every path it updates
+class RecordingBackend(PosixAclBackend):
+    def __init__(self):
+        self.updated = []
+
+    def update(self, path, is_dir, inherited, skip_existing):
+        self.updated.append(path)
+        return super().update(path, is_dir, inherited, skip_existing)
+
+
+# should_stop callback that requests a stop after a fixed number of checks
+def stop_after(checks):
+    calls = []
+
+    def should_stop():
+        calls.append(None)
+        return len(calls) > checks
+
+    return should_stop
+
+
+def test_full_propagation(tree, tmp_path):
+    checkpoint_path = str(tmp_path / "acl.checkpoint")
+    result = AclPropagator(str(tree), PosixAclBackend(), checkpoint_path, batch_size=4).run()
+
+    entries = all_entries(tree)
+    assert result.completed
+    assert result.processed == result.applied == len(entries)
+    assert result.errors == []
+    assert not os.path.exists(checkpoint_path)
+    assert_full_access(tree)
+
+
+def test_progress_is_reported(tree):
+    reports = []
+    result = AclPropagator(str(tree), PosixAclBackend(), batch_size=2, workers=1, progress_interval=0,
+                           progress_callback=lambda processed, rate: reports.append((processed, rate))).run()
+
+    assert result.completed
+    assert len(reports) > 1
+    assert [processed for processed, _ in reports] == sorted(processed for processed, _ in reports)
+    assert all(rate >= 0 for _, rate in reports)
+    assert reports[-1][0] == result.processed == len(all_entries(tree))
+
+
+def test_stop_then_resume(tree, tmp_path):
+    checkpoint_path = str(tmp_path / "acl.checkpoint")
+    total = len(all_entries(tree))
+
+    first = AclPropagator(str(tree), PosixAclBackend(), checkpoint_path, batch_size=2, workers=1,
+                          should_stop=stop_after(5)).run()
+    assert not first.completed
+    assert 0 < first.applied < total
+    assert os.path.exists(checkpoint_path)
+
+    # skip_existing is off, so only the checkpoint keeps finished folders from being processed again
+    second = AclPropagator(str(tree), PosixAclBackend(), checkpoint_path, resume=True, skip_existing=False,
+                           batch_size=2).run()
+    assert second.completed
+    assert second.processed < total
+    assert not os.path.exists(checkpoint_path)
+    assert_full_access(tree)
+
+
+def test_failed_folder_is_retried_on_resume(tree, tmp_path):
+    checkpoint_path = str(tmp_path / "acl.checkpoint")
+    failing_file = str(tree / "folder0" / "file3.txt")
+
+    class FailingBackend(PosixAclBackend):
+        def update(self, path, is_dir, inherited, skip_existing):
+            if path == failing_file:
+                raise PermissionError(errno.EACCES, "Access is denied", path)
+            return super().update(path, is_dir, inherited, skip_existing)
+
+    first = AclPropagator(str(tree), FailingBackend(), checkpoint_path).run()
+    assert not first.completed
+    assert [path for path, _ in first.errors] == [os.path.join("folder0", "file3.txt")]
+    assert os.path.exists(checkpoint_path)
+
+    backend = RecordingBackend()
+    second = AclPropagator(str(tree), backend, checkpoint_path, resume=True).run()
+    assert second.completed
+    assert failing_file in backend.updated
+    # Folders without failures were recorded as finished and are not visited again
+    assert not any(path.startswith(str(tree / "level0" / "folder1")) for path in backend.updated)
+    assert mode(failing_file) == 0o666
+    assert not os.path.exists(checkpoint_path)
+
+
+def test_torn_checkpoint_line_is_ignored(tree, tmp_path):
+    checkpoint_path = str(tmp_path / "acl.checkpoint")
+    AclPropagator(str(tree), PosixAclBackend(), checkpoint_path, batch_size=2, workers=1,
+                  should_stop=stop_after(5)).run()
+    # Simulate an interruption in the middle of writing a line
+    with open(checkpoint_path, "a", encoding="utf-8") as f:
+        f.write('"level0/fol')
+
+    second = AclPropagator(str(tree), PosixAclBackend(), checkpoint_path, resume=True, batch_size=2, workers=1,
+                           should_stop=stop_after(5)).run()
+    assert not second.completed
+
+    # The torn line stays on its own and every line written after it is intact
+    lines = open(checkpoint_path, encoding="utf-8").read().splitlines()
+    assert '"level0/fol' in lines[:-1]
+    for line in lines:
+        if line != '"level0/fol':
+            json.loads(line)
+
+    third = AclPropagator(str(tree), PosixAclBackend(), checkpoint_path, resume=True).run()
+    assert third.completed
+    assert_full_access(tree)
+
+
+def test_new_run_ignores_stale_checkpoint(tree, tmp_path):
+    checkpoint_path = str(tmp_path / "acl.checkpoint")
+    AclPropagator(str(tree), PosixAclBackend(), checkpoint_path, batch_size=2, workers=1,
+                  should_stop=stop_after(5)).run()
+
+    result = AclPropagator(str(tree), PosixAclBackend(), checkpoint_path).run()
+    assert result.completed
+    assert result.processed == len(all_entries(tree))
+
+
+def test_skip_existing_counts(tree):
+    total = len(all_entries(tree))
+    AclPropagator(str(tree), PosixAclBackend()).run()
+
+    skipped = AclPropagator(str(tree), PosixAclBackend(), skip_existing=True).run()
+    assert (skipped.applied, skipped.skipped) == (0, total)
+
+    reapplied = AclPropagator(str(tree), PosixAclBackend(), skip_existing=False).run()
+    assert (reapplied.applied, reapplied.skipped) == (total, 0)
+
+
+def test_symlinks_are_not_followed(tree, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    outside_file = outside / "secret.txt"
+    outside_file.write_text("data")
+    outside_file.chmod(0o600)
+    (tree / "link").symlink_to(outside, target_is_directory=True)
+
+    result = AclPropagator(str(tree), PosixAclBackend()).run()
+
+    assert result.completed
+    assert result.skipped == 1
+    assert mode(outside_file) == 0o600
+
+
+def test_protected_folders_are_left_alone(tree):
+    class ProtectedBackend(PosixAclBackend):
+        def is_protected(self, path):
+            return os.path.basename(path) == "level1"
+
+    result = AclPropagator(str(tree), ProtectedBackend()).run()
+
+    assert result.completed
+    assert result.protected == 1
+    for path in all_entries(tree / "level0" / "level1"):
+        if os.path.isfile(path):
+            assert mode(path) == 0o600
+
+
+# Minimal stand-ins for the pywin32 modules used by WindowsAclBackend
+ALLOWED, DENIED = 0, 1
+OI, CI, INHERITED = 0x1, 0x2, 0x10
+FULL_ACCESS = 0x1F01FF
+
+
+class FakeSid:
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, FakeSid) and other.name == self.name
+
+    def GetLength(self):
+        return 12
+
+
+class FakeAcl:
+    def __init__(self, aces=None):
+        self.aces = list(aces or [])
+
+    def GetAceCount(self):
+        return len(self.aces)
+
+    def GetAce(self, index):
+        return self.aces[index]
+
+    def GetAclSize(self):
+        return 8 + 20 * len(self.aces)
+
+    def AddAccessAllowedAceEx(self, revision, flags, mask, sid):
+        self.aces.append(((ALLOWED, flags), mask, sid))
+
+    def AddAccessDeniedAceEx(self, revision, flags, mask, sid):
+        self.aces.append(((DENIED, flags), mask, sid))
+
+
+class FakeDescriptor:
+    def __init__(self, aces, control=0):
+        self.dacl = FakeAcl(aces)
+        self.control = control
+
+    def GetSecurityDescriptorControl(self):
+        return self.control, 1
+
+    def GetSecurityDescriptorDacl(self):
+        return self.dacl
+
+    def SetSecurityDescriptorDacl(self, present, dacl, defaulted):
+        self.dacl = dacl
+
+
+class FakeError(Exception):
+    def __init__(self, winerror, funcname, strerror):
+        super().__init__(winerror, funcname, strerror)
+        self.winerror, self.funcname, self.strerror = winerror, funcname, strerror
+
+
+# Install the pywin32 stand-ins; returns the path -> FakeDescriptor table they read and write
+# and a counter of how often each path was opened
+@pytest.fixture
+def win32(monkeypatch):
+    table = {}
+    opens = collections.Counter()
+
+    def create_file(path, *args):
+        if path not in table:
+            raise FakeError(2, "CreateFile", "The system cannot find the file specified.")
+        opens[path] += 1
+        return types.SimpleNamespace(path=path, Close=lambda: None)
+
+    def set_kernel_object_security(handle, info, descriptor):
+        table[handle.path] = descriptor
+
+    modules = {
+        "pywintypes": types.SimpleNamespace(error=FakeError),
+        "ntsecuritycon": types.SimpleNamespace(FILE_ALL_ACCESS=FULL_ACCESS),
+        "win32con": types.SimpleNamespace(
+            FILE_SHARE_READ=1, FILE_SHARE_WRITE=2, FILE_SHARE_DELETE=4, OPEN_EXISTING=3,
+            FILE_FLAG_BACKUP_SEMANTICS=0x02000000, READ_CONTROL=0x20000, WRITE_DAC=0x40000),
+        "win32file": types.SimpleNamespace(CreateFile=create_file, FILE_FLAG_OPEN_REPARSE_POINT=0x00200000),
+        "win32security": types.SimpleNamespace(
+            ConvertStringSidToSid=lambda text: FakeSid("Everyone" if text == "S-1-1-0" else text),
+            ConvertSidToStringSid=lambda sid: sid.name,
+            GetKernelObjectSecurity=lambda handle, info: table[handle.path],
+            SetKernelObjectSecurity=set_kernel_object_security,
+            ACL=lambda size: FakeAcl(),
+            OBJECT_INHERIT_ACE=OI, CONTAINER_INHERIT_ACE=CI, INHERITED_ACE=INHERITED,
+            ACCESS_ALLOWED_ACE_TYPE=ALLOWED, ACCESS_DENIED_ACE_TYPE=DENIED,
+            ACCESS_ALLOWED_OBJECT_ACE_TYPE=5, ACCESS_DENIED_OBJECT_ACE_TYPE=6,
+            ACL_REVISION_DS=4, DACL_SECURITY_INFORMATION=4, SE_DACL_PROTECTED=0x1000),
+    }
+    for name, module in modules.items():
+        monkeypatch.setitem(sys.modules, name, module)
+    return types.SimpleNamespace(descriptors=table, opens=opens)
+
+
+def test_windows_rule_is_ordered_before_aces_from_above_the_root(win32):
+    descriptors = win32.descriptors
+    everyone, guests, system = FakeSid("Everyone"), FakeSid("Guests"), FakeSid("SYSTEM")
+    bob, users = FakeSid("Bob"), FakeSid("Users")
+
+    # The root inherits a deny for Guests and an allow for SYSTEM from a parent of the share
+    descriptors["root"] = FakeDescriptor([
+        ((DENIED, INHERITED | CI | OI), FULL_ACCESS, guests),
+        ((ALLOWED, INHERITED | CI | OI), FULL_ACCESS, system),
+    ])
+    # The file also inherits an allow for Users from a folder inside the root
+    descriptors["root/folder/file"] = FakeDescriptor([
+        ((ALLOWED, 0), FULL_ACCESS, bob),
+        ((ALLOWED, INHERITED), FULL_ACCESS, users),
+        ((DENIED, INHERITED), FULL_ACCESS, guests),
+        ((ALLOWED, INHERITED), FULL_ACCESS, system),
+    ])
+
+    backend = WindowsAclBackend()
+    backend.prepare("root")
+    assert backend.update("root", True, False, True) == "applied"
+    assert backend.update("root/folder/file", False, True, False) == "applied"
+    # Running again without skip_existing must not add a second Everyone ACE
+    assert backend.update("root/folder/file", False, True, False) == "applied"
+
+    assert descriptors["root"].dacl.aces == [
+        ((ALLOWED, CI | OI), FULL_ACCESS, everyone),
+        ((DENIED, INHERITED | CI | OI), FULL_ACCESS, guests),
+        ((ALLOWED, INHERITED | CI | OI), FULL_ACCESS, system),
+    ]
+    assert descriptors["root/folder/file"].dacl.aces == [
+        ((ALLOWED, 0), FULL_ACCESS, bob),
+        ((ALLOWED, INHERITED), FULL_ACCESS, users),
+        ((ALLOWED, INHERITED), FULL_ACCESS, everyone),
+        ((DENIED, INHERITED), FULL_ACCESS, guests),
+        ((ALLOWED, INHERITED), FULL_ACCESS, system),
+    ]
+
+
+def test_windows_reads_each_descriptor_once(win32, tree):
+    paths = [str(tree)] + all_entries(tree)
+    for path in paths:
+        win32.descriptors[path] = FakeDescriptor([])
+
+    result = AclPropagator(str(tree), WindowsAclBackend()).run()
+
+    assert result.completed
+    assert result.applied == len(paths) - 1
+    # One open to read the descriptor and one to write it back; the root is also read by prepare()
+    assert win32.opens[str(tree)] == 3
+    assert all(win32.opens[path] == 2 for path in paths[1:])
+
+
+def test_windows_missing_entry_raises_file_not_found(win32):
+    with pytest.raises(FileNotFoundError):
+        WindowsAclBackend().update("root/gone", False, True, True)
+
+
+def test_vanished_entries_are_skipped(tree, tmp_path):
+    class VanishingBackend(PosixAclBackend):
+        def update(self, path, is_dir, inherited, skip_existing):
+            if os.path.basename(path) == "file0.txt":
+                os.remove(path)
+            return super().update(path, is_dir, inherited, skip_existing)
+
+    checkpoint_path = str(tmp_path / "acl.checkpoint")
+    result = AclPropagator(str(tree), VanishingBackend(), checkpoint_path).run()
+
+    assert result.completed
+    assert result.errors == []
+    assert result.skipped == 6
+    assert not os.path.exists(checkpoint_path)
@@ -9,23 +9,34 @@ import sys
 from subprocess import CREATE_NO_WINDOW
 from mapdrivethread import MapDriveThread
 from sharefolderthread import ShareFolderThread
+from aclpropagationthread import AclPropagationThread
+from aclpropagation import default_checkpoint_path, discard_checkpoint
 import win32net
 
 # Third-party imports
 from PyQt5.QtCore import pyqtSlot, QThread, pyqtSignal, Qt
 from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import (QApplication, QComboBox, QFileDialog, QFrame, QGridLayout, QLabel, QLineEdit, QMessageBox, 
+from PyQt5.QtWidgets import (QApplication, QCheckBox, QComboBox, QFileDialog, QFrame, QGridLayout, QLabel, QLineEdit, QMessageBox, 
                               QPushButton, QTextEdit, QVBoxLayout, QWidget, QTableWidget, QHeaderView, QTableWidgetItem, QGroupBox)
                               
 
 
 
+# How long the GUI waits for the ACL propagation thread to stop before giving up
+ACL_STOP_TIMEOUT_MS = 5000
+
+
 # Define the NetworkDriveMapper class
 class NetworkDriveMapper(QWidget):
 
     def __init__(self):
         super().__init__()
 
+        # No ACL propagation job is running on program start
+        self.acl_propagation_thread_running = False
+        # Folder whose ACL checkpoint is removed once the running job has stopped
+        self.acl_checkpoint_to_discard = None
+
         # Configure the window
         self.configure_window()
 
@@ -80,6 +91,19 @@ class NetworkDriveMapper(QWidget):
         self.add_adv_shared_button = QPushButton("Share/Create")
         self.add_adv_shared_button.setIcon(QIcon("share_icon.png"))
 
+        # Create and configure the "Skip entries that already have the ACL" checkbox
+        self.skip_existing_acl_checkbox = QCheckBox("Skip entries that already have the ACL")
+        self.skip_existing_acl_checkbox.setChecked(True)
+
+        # Create and configure the ACL propagation progress label
+        self.acl_progress_label = QLabel("")
+
+        # Create and configure the "Stop ACL" button
+        self.stop_acl_button = QPushButton("Stop ACL")
+        self.stop_acl_button.setIcon(QIcon("stop_icon.png"))
+        self.stop_acl_button.setToolTip("Stop applying the ACL; it resumes from a checkpoint on the next share")
+        self.stop_acl_button.setEnabled(False)
+
         # Create and configure a separator line
         self.separator_line = QFrame()
         self.separator_line.setFrameShape(QFrame.HLine)
@@ -166,6 +190,9 @@ class NetworkDriveMapper(QWidget):
         share_folder_layout.addWidget(self.adv_shared_path_input, 0, 1)
         share_folder_layout.addWidget(self.browse_button, 0, 2)
         share_folder_layout.addWidget(self.add_adv_shared_button, 0, 3)
+        share_folder_layout.addWidget(self.skip_existing_acl_checkbox, 1, 0)
+        share_folder_layout.addWidget(self.acl_progress_label, 1, 1, 1, 2)
+        share_folder_layout.addWidget(self.stop_acl_button, 1, 3)
         share_folder_group.setLayout(share_folder_layout)
         layout.addWidget(share_folder_group)
 
@@ -232,6 +259,9 @@ class NetworkDriveMapper(QWidget):
 
         # Connect the Stop button to a slot
         self.stop_button.clicked.connect(self.stop_map_drive_thread) # Added
+
+        # Connect the Stop ACL button to a slot
+        self.stop_acl_button.clicked.connect(self.stop_acl_propagation_thread)
         
         # Connect the Clear Log button to a slot
         self.clear_log_button.clicked.connect(self.clear_log)
@@ -310,6 +340,10 @@ class NetworkDriveMapper(QWidget):
         # Check output for specific messages and handle accordingly
         if "Folder is already shared." in output:
             self.log_widget.append("Folder is already shared.")
+            # Resume an ACL propagation that was stopped before it finished
+            folder_path = self.share_folder_thread.folder_path
+            if os.path.exists(default_checkpoint_path(folder_path)):
+                self.start_acl_propagation_thread(folder_path, resume=True)
         elif "FailedToUpdateACL" in output:
             self.log_widget.append("Failed to update the ACL for full control.")
         elif "FolderCreatedAndShared" in output:
@@ -317,6 +351,7 @@ class NetworkDriveMapper(QWidget):
         elif "FolderShared" in output:
             self.log_message("Folder has been shared successfully.")
             self.reset_fields()
+            self.start_acl_propagation_thread(self.share_folder_thread.folder_path)
 
         else:
             self.log_widget.append(f"Failed to share the folder:\n\n{output}")
@@ -325,11 +360,78 @@ class NetworkDriveMapper(QWidget):
     # Function to re-enable buttons after folder sharing thread is finished
     @pyqtSlot() 
     def share_folder_thread_finished(self):
-        self.add_adv_shared_button.setEnabled(True)
+        self.add_adv_shared_button.setEnabled(not self.acl_propagation_thread_running)
         self.connect_button.setEnabled(True)
     # Call the retrieve_shared_folders method to update the table
         self.retrieve_shared_folders()
 
+
+    # Start the ACL propagation thread for a newly shared folder
+    def start_acl_propagation_thread(self, folder_path, resume=False):
+        self.add_adv_shared_button.setEnabled(False)
+
+        self.acl_propagation_thread = AclPropagationThread(folder_path, self.skip_existing_acl_checkbox.isChecked(), resume)
+        self.acl_propagation_thread.output_signal.connect(self.handle_acl_propagation_output)
+        self.acl_propagation_thread.progress_signal.connect(self.handle_acl_propagation_progress)
+        self.acl_propagation_thread.finished.connect(self.acl_propagation_thread_finished)
+        self.acl_propagation_thread.start()
+        if resume:
+            self.log_message("Resuming full control ACL from checkpoint...")
+        else:
+            self.log_message("Applying full control ACL...")
+        self.acl_propagation_thread_running = True
+        self.stop_acl_button.setEnabled(True)
+
+
+    # Show progress from the ACL propagation thread
+    @pyqtSlot(int, float)
+    def handle_acl_propagation_progress(self, processed, rate):
+        self.acl_progress_label.setText(f"ACL: {processed} entries ({rate:.0f} files/s)")
+
+
+    # Handle output from the ACL propagation thread
+    @pyqtSlot(str)
+    def handle_acl_propagation_output(self, output):
+        status, _, details = output.partition("\n")
+        if status == "AclPropagationComplete":
+            self.log_message(f"Full control ACL applied: {details}")
+        elif status == "AclPropagationStopped":
+            self.log_message(f"Stopped applying ACL, progress saved: {details}")
+        else:
+            self.log_widget.append(f"Failed to update the ACL for full control:\n\n{details}")
+
+
+    # Function to re-enable buttons after ACL propagation thread is finished
+    @pyqtSlot()
+    def acl_propagation_thread_finished(self):
+        self.acl_propagation_thread_running = False
+        if self.acl_checkpoint_to_discard:
+            self.discard_acl_checkpoint(self.acl_checkpoint_to_discard)
+            self.acl_checkpoint_to_discard = None
+        self.add_adv_shared_button.setEnabled(True)
+        self.stop_acl_button.setEnabled(False)
+
+
+    # Ask the ACL propagation thread to stop and wait a bounded time; returns False if it is still running
+    def wait_for_acl_propagation_thread(self):
+        self.acl_propagation_thread.requestInterruption()
+        return self.acl_propagation_thread.wait(ACL_STOP_TIMEOUT_MS)
+
+
+    def discard_acl_checkpoint(self, folder_path):
+        try:
+            discard_checkpoint(folder_path)
+        except OSError as e:
+            self.log_message(f"Failed to remove the ACL checkpoint for '{folder_path}': {e}")
+
+
+    # Stop the ACL propagation thread; it saves a checkpoint so the next run resumes
+    def stop_acl_propagation_thread(self):
+        if self.acl_propagation_thread_running:
+            self.acl_propagation_thread.requestInterruption()
+            self.stop_acl_button.setEnabled(False)
+            self.log_message("Stopping ACL propagation...")
+
     # Start the drive mapping thread
     def connect_drive_thread(self):
         # Disable buttons during drive mapping process
@@ -440,9 +542,22 @@ class NetworkDriveMapper(QWidget):
 
         for row in selected_rows:
             shared_folder = self.shared_drives_table.item(row.row(), 0).text()
+            local_path = self.shared_drives_table.item(row.row(), 1).text()
             result = subprocess.run(f"net share {shared_folder} /delete", shell=True, text=True, capture_output=True)
             if result.returncode == 0:
                 self.log_message(f"Shared folder '{shared_folder}' has been disconnected.")
+                # A later share starts the ACL over, so an unfinished checkpoint is no longer needed.
+                # A job still working on this folder has the checkpoint open and must stop first
+                if (self.acl_propagation_thread_running
+                        and os.path.normcase(os.path.abspath(self.acl_propagation_thread.folder_path))
+                        == os.path.normcase(os.path.abspath(local_path))):
+                    self.log_message(f"Stopping ACL propagation for '{local_path}'...")
+                    if self.wait_for_acl_propagation_thread():
+                        self.discard_acl_checkpoint(local_path)
+                    else:
+                        self.acl_checkpoint_to_discard = local_path
+                else:
+                    self.discard_acl_checkpoint(local_path)
                 self.shared_drives_table.removeRow(row.row())
             else:
                 self.log_message(f"Failed to disconnect shared folder '{shared_folder}': {result.stderr}")
@@ -495,6 +610,9 @@ class NetworkDriveMapper(QWidget):
         confirm_box.setDefaultButton(QMessageBox.No)
         reply = confirm_box.exec_()
         if reply == QMessageBox.Yes:
+            # Give the ACL propagation thread a bounded time to save its checkpoint before exiting
+            if self.acl_propagation_thread_running and not self.wait_for_acl_propagation_thread():
+                self.log_message("ACL propagation did not stop in time; its checkpoint may be incomplete.")
             event.accept()
         else:
             event.ignore()